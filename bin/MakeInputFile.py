@@ -30,12 +30,14 @@ def main():
     out.append("# Note: Boolean option types require no value, the key being present implies 'True'")
     out.append("# Note: List option types are specified using spaces as the delimiter - i.e. forcefield ff1.itp ff2.itp ; delete empty brackets before use [] ")
     out.append("")
-    out += parser.printsection("$options",options,parser.gen_opts_types)
-    for tgt_opt in tgt_opts:
-        out.append("\n")
-        out += parser.printsection("$target",tgt_opt,parser.tgt_opts_types)
     for line in out:
         print(line)
+    for line in parser.iter_section("$options",options,parser.gen_opts_types):
+        print(line)
+    for tgt_opt in tgt_opts:
+        print("\n")
+        for line in parser.iter_section("$target",tgt_opt,parser.tgt_opts_types):
+            print(line)
 
 if __name__ == "__main__":
     main()
@@ -5,6 +5,7 @@ from __future__ import division
 
 from builtins import range
 from builtins import object
+import os
 import sys
 import inspect
 #from implemented import Implemented_Targets
@@ -12,12 +13,17 @@ import numpy as np
 from collections import defaultdict, OrderedDict
 import forcebalance
 from forcebalance.finite_difference import in_fd
-from forcebalance.nifty import printcool_dictionary, createWorkQueue, getWorkQueue, wq_wait
+from forcebalance.nifty import printcool_dictionary, createWorkQueue, getWorkQueue, wq_wait, warn_press_key
 import datetime
 import traceback
 from forcebalance.output import getLogger
 logger = getLogger(__name__)
 
+try:
+    from scipy.linalg.blas import daxpy
+except ImportError:
+    daxpy = None
+
 try:
     from forcebalance.gmxio import AbInitio_GMX, BindingEnergy_GMX, Liquid_GMX, Lipid_GMX, Interaction_GMX, Moments_GMX, Vibration_GMX, Thermo_GMX
 except:
@@ -134,6 +140,35 @@ Implemented_Targets = {
 ## This is the canonical lettering that corresponds to : objective function, gradient, Hessian.
 Letters = ['X','G','H']
 
+## Kernels for the fusion penalties.  Each one takes the sorted log-parameters
+## of one element / angular momentum group and the penalty parameters a, b and b2 = b*b,
+## and returns the penalty and its derivative with respect to each nearest-neighbor difference dp.
+## The second derivatives have off-diagonal terms, but we're not using them right now anyway.
+
+def _fuse_kernel(lp, a, b, b2):
+    """ L1 fusion penalty (hyperbolic function of the log-differences). """
+    dp = lp[1:] - lp[:-1]
+    sqt = (dp*dp + b2)**0.5
+    # Second derivative: b2/sqt**3
+    return np.sum(sqt - b), dp/sqt
+
+def _fuse_barrier_kernel(lp, a, b, b2):
+    """ L1 fusion penalty with a log barrier that keeps the parameters from coalescing. """
+    dp = lp[1:] - lp[:-1]
+    sqt = (dp*dp + b2)**0.5
+    # Second derivative: b2/sqt**3 - a/dp**2
+    return np.sum(sqt - b - a*np.log(dp) + a*np.log(a)), dp/sqt - a/dp
+
+def _fuse_l0_kernel(lp, a, b, b2):
+    """ L0-L1 fusion penalty, which saturates to 1 per pair at distances beyond ~1/a. """
+    dp = lp[1:] - lp[:-1]
+    sqt = (dp*dp + b2)**0.5
+    h   = a*(sqt - b)
+    hp  = a*dp/sqt
+    emh = np.exp(-h)
+    # Second derivative: (hpp - hp**2)*emh with hpp = a*b2/sqt**3
+    return np.sum(1.0 - emh), hp*emh
+
 class Objective(forcebalance.BaseClass):
     """ Objective function.
 
@@ -160,6 +195,8 @@ class Objective(forcebalance.BaseClass):
         self.set_option(options, 'penalty_alpha')
         self.set_option(options, 'penalty_power')
         self.set_option(options, 'normalize_weights')
+        ## Step size for the finite difference Hessian-vector product
+        self.set_option(options, 'finite_difference_h', 'h')
         ## Work Queue Port (The specific target itself may or may not actually use this.)
         self.set_option(options, 'wq_port')
         ## Asynchronous objective function evaluation (i.e. execute Work Queue and local objective concurrently.)
@@ -198,6 +235,7 @@ class Objective(forcebalance.BaseClass):
             self.WTot = np.sum([i.weight for i in self.Targets])
         else:
             self.WTot = 1.0
+        self._inv_WTot = 1.0/self.WTot
         self.ObjDict = OrderedDict()
         self.ObjDict_Last = OrderedDict()
 
@@ -209,9 +247,53 @@ class Objective(forcebalance.BaseClass):
         printcool_dictionary(self.PrintOptionDict, "Setup for objective function :")
 
 
+    def _evaluate_target(self, Tgt, mvals, Order, verbose, customdir, fd):
+        """ Evaluate a single target at the requested order and record its
+        contribution in the objective function breakdown (unless we are
+        inside a finite difference calculation). """
+        # List of functions that I can call.
+        Funcs   = [Tgt.get_X, Tgt.get_G, Tgt.get_H]
+        # Call the appropriate function
+        Ans = Funcs[Order](mvals, customdir=customdir)
+        # Print out the qualitative indicators
+        if verbose:
+            Tgt.meta_indicate(customdir=customdir)
+        if not fd:
+            self.ObjDict[Tgt.name] = {'w' : Tgt.weight*self._inv_WTot , 'x' : Ans['X']}
+        return Ans
+
+    def _accumulate(self, Objective, Ans, scale, tmpG, tmpH):
+        """ Add the contribution of one target, multiplied by its normalized weight,
+        to the objective function, gradient and Hessian.  If BLAS is available,
+        daxpy accumulates into the gradient and Hessian (in place, for contiguous arrays);
+        otherwise the products are formed in the preallocated buffers tmpG and tmpH
+        to avoid temporary arrays. """
+        Objective['X'] += Ans['X']*scale
+        if daxpy is not None:
+            # daxpy updates y in place only if it is a contiguous array of doubles,
+            # so the returned array is always stored.
+            Objective['G'] = daxpy(np.ravel(Ans['G']), Objective['G'], a=scale)
+            Objective['H'] = daxpy(np.ravel(Ans['H']), Objective['H'].ravel(), a=scale).reshape(Objective['H'].shape)
+        else:
+            Objective['G'] += np.multiply(Ans['G'], scale, out=tmpG)
+            Objective['H'] += np.multiply(Ans['H'], scale, out=tmpH)
+
     def Target_Terms(self, mvals, Order=0, verbose=False, customdir=None):
         ## This is the objective function; it's a dictionary containing the value, first and second derivatives
         Objective = {'X':0.0, 'G':np.zeros(self.FF.np), 'H':np.zeros((self.FF.np,self.FF.np))}
+        # Whether we are inside a finite difference calculation; this walks the call stack,
+        # so it is evaluated once here rather than once per target.
+        fd = in_fd()
+        # Start a new breakdown of the objective function; the previous one may be kept
+        # by the optimizer as ObjDict_Last.  (Finite difference calls do not record anything.)
+        if not fd:
+            self.ObjDict = OrderedDict()
+        # Scratch space for the weighted gradient and Hessian of each target (not needed with BLAS).
+        if daxpy is None:
+            tmpG = np.empty(self.FF.np)
+            tmpH = np.empty((self.FF.np,self.FF.np))
+        else:
+            tmpG = tmpH = None
         # Loop through the targets, stage the directories and submit the Work Queue processes.
         for Tgt in self.Targets:
             Tgt.stage(mvals, AGrad = Order >= 1, AHess = Order >= 2, customdir=customdir)
@@ -226,18 +308,9 @@ class Objective(forcebalance.BaseClass):
             while len(Need2Evaluate) > 0:
                 for Tgt in Need2Evaluate:
                     if Tgt.wq_complete():
-                        # List of functions that I can call.
-                        Funcs   = [Tgt.get_X, Tgt.get_G, Tgt.get_H]
-                        # Call the appropriate function
-                        Ans = Funcs[Order](mvals, customdir=customdir)
-                        # Print out the qualitative indicators
-                        if verbose:
-                            Tgt.meta_indicate(customdir=customdir)
+                        Ans = self._evaluate_target(Tgt, mvals, Order, verbose, customdir, fd)
                         # Note that no matter which order of function we call, we still increment the objective / gradient / Hessian the same way.
-                        if not in_fd():
-                            self.ObjDict[Tgt.name] = {'w' : Tgt.weight/self.WTot , 'x' : Ans['X']}
-                        for i in range(3):
-                            Objective[Letters[i]] += Ans[Letters[i]]*Tgt.weight/self.WTot
+                        self._accumulate(Objective, Ans, Tgt.weight*self._inv_WTot, tmpG, tmpH)
                         Need2Evaluate.remove(Tgt)
                         break
                     else:
@@ -249,18 +322,9 @@ class Objective(forcebalance.BaseClass):
             for Tgt in self.Targets:
                 # The first call is always done at the midpoint.
                 Tgt.bSave = True
-                # List of functions that I can call.
-                Funcs   = [Tgt.get_X, Tgt.get_G, Tgt.get_H]
-                # Call the appropriate function
-                Ans = Funcs[Order](mvals, customdir=customdir)
-                # Print out the qualitative indicators
-                if verbose:
-                    Tgt.meta_indicate(customdir=customdir)
+                Ans = self._evaluate_target(Tgt, mvals, Order, verbose, customdir, fd)
                 # Note that no matter which order of function we call, we still increment the objective / gradient / Hessian the same way.
-                if not in_fd():
-                    self.ObjDict[Tgt.name] = {'w' : Tgt.weight/self.WTot , 'x' : Ans['X']}
-                for i in range(3):
-                    Objective[Letters[i]] += Ans[Letters[i]]*Tgt.weight/self.WTot
+                self._accumulate(Objective, Ans, Tgt.weight*self._inv_WTot, tmpG, tmpH)
         # The target has evaluated at least once.
         for Tgt in self.Targets:
             Tgt.evaluated = True
@@ -273,25 +337,24 @@ class Objective(forcebalance.BaseClass):
     def Indicate(self):
         """ Print objective function contributions. """
         PrintDict = OrderedDict()
-        Total = 0.0
-        Change = False
         color = "\x1b[0m"
-        for key, val in self.ObjDict.items():
-            if key == 'Total' : continue
-            color = "\x1b[94m"
-            if key in self.ObjDict_Last:
-                Change = True
-                # print(self.ObjDict[key], self.ObjDict_Last[key])
-                if self.ObjDict[key]['x'] <= self.ObjDict_Last[key]['x']:
-                    color = "\x1b[92m"
-                elif self.ObjDict[key]['x'] > self.ObjDict_Last[key]['x']:
-                    color = "\x1b[91m"
-            PrintDict[key] = "% 12.5f % 10.3f %s% 16.5e%s" % (val['x'],val['w'],color,val['x']*val['w'],"\x1b[0m")
-            if Change:
-                xnew = self.ObjDict[key]['x'] * self.ObjDict[key]['w']
+        keys = [key for key in self.ObjDict if key != 'Total']
+        xs = np.fromiter((self.ObjDict[key]['x'] for key in keys), dtype=float, count=len(keys))
+        ws = np.fromiter((self.ObjDict[key]['w'] for key in keys), dtype=float, count=len(keys))
+        contribs = xs*ws
+        Total = float(np.sum(contribs))
+        # Residuals from the previous iteration (NaN for targets that were not there);
+        # green for a decrease and red for an increase, otherwise blue.
+        xlast = np.fromiter((self.ObjDict_Last[key]['x'] if key in self.ObjDict_Last else np.nan for key in keys), dtype=float, count=len(keys))
+        colors = np.where(xs <= xlast, "\x1b[92m", np.where(xs > xlast, "\x1b[91m", "\x1b[94m"))
+        # The change is printed for each target that has a previous value.
+        changes = [key in self.ObjDict_Last for key in keys]
+        for key, x, w, contrib, color, changed in zip(keys, xs, ws, contribs, colors, changes):
+            PrintDict[key] = "% 12.5f % 10.3f %s% 16.5e%s" % (x,w,color,contrib,"\x1b[0m")
+            if changed:
                 xold = self.ObjDict_Last[key]['x'] * self.ObjDict_Last[key]['w']
-                PrintDict[key] += " ( %+10.3e )" % (xnew - xold)
-            Total += val['x']*val['w']
+                PrintDict[key] += " ( %+10.3e )" % (contrib - xold)
+        Change = any(changes)
         self.ObjDict['Total'] = Total
         if 'Total' in self.ObjDict_Last:
             Change = True
@@ -300,10 +363,11 @@ class Objective(forcebalance.BaseClass):
             elif self.ObjDict['Total'] > self.ObjDict_Last['Total']:
                 color = "\x1b[91m"
         PrintDict['Total'] = "% 12s % 10s %s% 16.5e%s" % ("","",color,Total,"\x1b[0m")
-        if Change:
+        if 'Total' in self.ObjDict_Last:
             xnew = self.ObjDict['Total']
             xold = self.ObjDict_Last['Total']
             PrintDict['Total'] += " ( %+10.3e )" % (xnew - xold)
+        if Change:
             Title = "Objective Function Breakdown\n %-20s %55s" % ("Target Name", "Residual  x  Weight  =  Contribution (Current-Prev)")
         else:
             Title = "Objective Function Breakdown\n %-20s %40s" % ("Target Name", "Residual  x  Weight  =  Contribution")
@@ -314,20 +378,68 @@ class Objective(forcebalance.BaseClass):
         Objective = self.Target_Terms(vals, Order, verbose, customdir)
         ## Compute the penalty function.
         if self.FF.use_pvals:
-            Extra = self.Penalty.compute(self.FF.create_mvals(vals),Objective)
+            Extra = self.Penalty.compute(self.FF.create_mvals(vals),Objective,Order)
         else:
-            Extra = self.Penalty.compute(vals,Objective)
+            Extra = self.Penalty.compute(vals,Objective,Order)
         Objective['X0'] = Objective['X']
-        Objective['G0'] = Objective['G'].copy()
-        Objective['H0'] = Objective['H'].copy()
+        Objective['G0'] = Objective['G']
+        Objective['H0'] = Objective['H']
         if not in_fd():
             self.ObjDict['Regularization'] = {'w' : 1.0, 'x' : Extra[0]}
             if verbose:
                 self.Indicate()
-        for i in range(3):
-            Objective[Letters[i]] += Extra[i]
+        # At zeroth order the penalty contributes only to the objective function.
+        # The sums are new arrays, so G0 and H0 keep the values without the penalty.
+        for i in range(3 if Order >= 1 else 1):
+            Objective[Letters[i]] = Objective[Letters[i]] + Extra[i]
         return Objective
 
+    def Hv(self, vals, v, Objective=None, customdir=None):
+        """ Product of the Hessian of the full objective function with a vector.
+
+        The target contribution is a forward finite difference of the
+        target gradients along v, so the target Hessians are never computed.
+        If the objective function dictionary from Full at vals is provided,
+        its unpenalized value and gradient (X0 and G0) are reused, and each
+        product costs one gradient evaluation.  The penalty contribution is
+        analytic.  This is meant for optimizers that only need Hessian-vector
+        products in problems with many parameters.
+
+        @param[in] vals The parameter vector (mathematical or physical, as in Full)
+        @param[in] v The vector to be multiplied by the Hessian
+        @param[in] Objective Objective function dictionary returned by Full(vals, Order>=1), or None
+        @param[in] customdir Custom directory for the evaluation at vals
+        @return Hv The Hessian-vector product
+        """
+        vals = np.asarray(vals, dtype=float)
+        v = np.asarray(v, dtype=float)
+        vnorm = np.linalg.norm(v)
+        if vnorm == 0.0:
+            return np.zeros(self.FF.np)
+        # The step along v has a length of finite_difference_h.
+        eps = self.h / vnorm
+        # These evaluations are not steps of the optimization, so the objective function breakdown is kept.
+        ObjDict = self.ObjDict
+        if Objective is None:
+            Objective = self.Target_Terms(vals, 1, customdir=customdir)
+            X0, G0 = Objective['X'], Objective['G']
+        else:
+            X0, G0 = Objective['X0'], Objective['G0']
+        # The displaced point runs in its own directory, because some targets reuse
+        # the results that they find in their run directory.
+        hvdir = "hessvec" if customdir is None else os.path.join(customdir, "hessvec")
+        G1 = self.Target_Terms(vals + eps*v, 1, customdir=hvdir)['G']
+        for Tgt in self.Targets:
+            Tgt.remove_custom_dir(hvdir)
+        self.ObjDict = ObjDict
+        TgtHv = (G1 - G0) / eps
+        ## Add the penalty function contribution.
+        Objective0 = {'X' : X0, 'G' : G0}
+        if self.FF.use_pvals:
+            return TgtHv + self.Penalty.Hv(self.FF.create_mvals(vals),v,Objective0,TgtHv)
+        else:
+            return TgtHv + self.Penalty.Hv(vals,v,Objective0,TgtHv)
+
 class Penalty(object):
     """ Penalty functions for regularizing the force field optimizer.
 
@@ -379,10 +491,13 @@ class Penalty(object):
         self.fmul = Factor_Mult
         self.a    = Alpha
         self.b    = Factor_B
+        self._b2  = Factor_B*Factor_B
         self.p    = Power
         self.FF   = ForceField
         self.ptyp = self.Pen_Names[User_Option.upper()]
         self.Pen_Tab = {1 : self.HYP, 2: self.L2_norm, 3: self.BOX, 4: self.FUSE, 5:self.FUSE_L0, 6: self.FUSE_BARRIER}
+        ## The penalty type is fixed, so the penalty function is looked up once here.
+        self._pen_fn = self.Pen_Tab[self.ptyp]
         if User_Option.upper() == 'L1':
             logger.info("L1 norm uses the hyperbolic penalty, make sure penalty_hyperbolic_b is set sufficiently small\n")
         elif self.ptyp == 1:
@@ -413,17 +528,56 @@ class Penalty(object):
             logger.error("Custom power %.2f is only supported with L2 or box-style regularization (penalty_type L2 or box)\n" % Power)
             raise RuntimeError
 
+        ## Parameter groups for the fusion penalties; built on first use.
+        self._fuse_groups = None
+        ## Zero gradient and Hessian for when the penalty is switched off.
+        self._zeroG = None
+        self._zeroH = None
+        ## Diagonal of the (constant) Hessian of the quadratic L2 penalty.
+        self._L2_H = None
         ## Find exponential spacings.
         if self.ptyp in [4,5,6]:
             self.spacings = self.FF.find_spacings()
             printcool_dictionary(self.spacings, title="Starting zeta spacings\n(Pay attention to these)")
 
-    def compute(self, mvals, Objective):
-        K0, K1, K2 = self.Pen_Tab[self.ptyp](mvals)
+    def _zeros(self, NP):
+        """ Shared read-only zero gradient and Hessian, returned when no penalty is active. """
+        if self._zeroG is None or len(self._zeroG) != NP:
+            self._zeroG = np.zeros(NP)
+            self._zeroH = np.zeros((NP, NP))
+            self._zeroG.flags.writeable = False
+            self._zeroH.flags.writeable = False
+        return self._zeroG, self._zeroH
+
+    def compute(self, mvals, Objective, Order=2):
+        """
+        Compute the contributions of the penalty function to the objective function.
+
+        @param[in] mvals The parameter vector
+        @param[in] Objective The objective function dictionary, used by the multiplicative penalty
+        @param[in] Order The requested order of differentiation; if zero, the gradient and Hessian are not computed
+        @return XAdd, GAdd, HAdd Contributions to the objective function, gradient and Hessian
+        """
+        # Nothing to do if neither the additive nor the multiplicative penalty is switched on.
+        if not (self.fadd > 0.0 or self.fmul > 0.0):
+            return (0.0,) + self._zeros(len(mvals))
+        K0, K1, K2 = self._pen_fn(mvals)
+        if Order < 1:
+            # Only the objective function is needed.
+            XAdd = K0 * self.fadd if self.fadd > 0.0 else 0.0
+            if self.fmul > 0.0:
+                XAdd += ( Objective['X']*K0 ) * self.fmul
+            return (XAdd,) + self._zeros(len(mvals))
+        # Penalty Hessians that are purely diagonal are returned as vectors of the diagonal elements.
+        K2diag = (np.ndim(K2) == 1)
         if self.fadd > 0.0:
             XAdd = K0 * self.fadd
             GAdd = K1 * self.fadd
-            HAdd = K2 * self.fadd
+            if K2diag:
+                HAdd = np.zeros((len(K2), len(K2)))
+                HAdd[np.diag_indices_from(HAdd)] = K2 * self.fadd
+            else:
+                HAdd = K2 * self.fadd
         else:
             NP = len(mvals)
             XAdd = 0.0
@@ -434,12 +588,45 @@ class Penalty(object):
             G = Objective['G']
             H = Objective['H']
             XAdd += ( X*K0 ) * self.fmul
-            GAdd += np.array( G*K0 + X*K1 ) * self.fmul
-            GK1 = np.reshape(G, (1, -1))*np.reshape(K1, (-1, 1))
-            K1G = np.reshape(K1, (1, -1))*np.reshape(G, (-1, 1))
-            HAdd += np.array( H*K0+GK1+K1G+X*K2 ) * self.fmul
+            GAdd += ( G*K0 + X*K1 ) * self.fmul
+            # Accumulate into HAdd in place rather than building the whole sum.
+            HAdd += H * (K0*self.fmul)
+            # Cross terms of the product rule; GK1[i,j] = K1[i]*G[j] and its transpose.
+            GK1 = np.einsum('i,j->ij', K1*self.fmul, G)
+            HAdd += GK1
+            HAdd += GK1.T
+            if K2diag:
+                HAdd[np.diag_indices_from(HAdd)] += ( X*K2 ) * self.fmul
+            else:
+                HAdd += ( X*K2 ) * self.fmul
         return XAdd, GAdd, HAdd
 
+    def Hv(self, mvals, v, Objective, TgtHv):
+        """
+        Compute the product of the penalty function Hessian with a vector,
+        without assembling the np x np Hessian.
+
+        @param[in] mvals The parameter vector
+        @param[in] v The vector to be multiplied by the Hessian
+        @param[in] Objective The objective function dictionary, used by the multiplicative penalty
+        @param[in] TgtHv Product of the target Hessian with v, used by the multiplicative penalty
+        @return HvAdd Contribution to the Hessian-vector product
+        """
+        v = np.asarray(v, dtype=float)
+        HvAdd = np.zeros(len(v))
+        if not (self.fadd > 0.0 or self.fmul > 0.0):
+            return HvAdd
+        K0, K1, K2 = self._pen_fn(mvals)
+        K2v = K2*v if np.ndim(K2) == 1 else np.dot(K2, v)
+        if self.fadd > 0.0:
+            HvAdd += K2v * self.fadd
+        if self.fmul > 0.0:
+            X = Objective['X']
+            G = Objective['G']
+            # Same terms as the multiplicative Hessian in compute(), each multiplied by v.
+            HvAdd += ( TgtHv*K0 + K1*np.dot(G, v) + G*np.dot(K1, v) + X*K2v ) * self.fmul
+        return HvAdd
+
     def L2_norm(self, mvals):
         """
         Harmonic L2-norm constraints.  These are the ones that I use
@@ -448,22 +635,27 @@ class Penalty(object):
         @param[in] mvals The parameter vector
         @return DC0 The norm squared of the vector
         @return DC1 The gradient of DC0
-        @return DC2 The Hessian (just a constant)
+        @return DC2 The Hessian (just a constant); for the default power of 2
+                    this is diagonal and only the diagonal elements are returned
 
         """
+        # np.asarray does not copy mvals if it is already an array of floats.
+        mvals = np.asarray(mvals, dtype=float)
         if self.p == 2.0:
-            mvals = np.array(mvals)
             DC0 = np.dot(mvals, mvals)
-            DC1 = 2*np.array(mvals)
-            DC2 = 2*np.eye(len(mvals))
+            DC1 = 2*mvals
+            # The Hessian is constant, so it is created once and reused.
+            if self._L2_H is None or len(self._L2_H) != len(mvals):
+                self._L2_H = 2*np.ones(len(mvals))
+                self._L2_H.flags.writeable = False
+            DC2 = self._L2_H
         else:
-            mvals = np.array(mvals)
             m2 = np.dot(mvals, mvals)
             p = float(self.p)
             DC0 = m2**(p/2)
             DC1 = p*(m2**(p/2-1))*mvals
-            DC2 = p*(m2**(p/2-1))*np.eye(len(mvals))
-            DC2 += p*(p-2)*(m2**(p/2-2))*np.outer(mvals, mvals)
+            DC2 = p*(p-2)*(m2**(p/2-2))*np.outer(mvals, mvals)
+            DC2[np.diag_indices_from(DC2)] += p*(m2**(p/2-1))
         return DC0, DC1, DC2
 
     def BOX(self, mvals):
@@ -477,17 +669,17 @@ class Penalty(object):
         @param[in] mvals The parameter vector
         @return DC0 The norm squared of the vector
         @return DC1 The gradient of DC0
-        @return DC2 The Hessian (just a constant)
+        @return DC2 The diagonal elements of the Hessian (the off-diagonal elements are zero)
         """
 
         if self.p == 2.0:
             return self.L2_norm(mvals)
         else:
-            mvals = np.array(mvals)
+            mvals = np.asarray(mvals, dtype=float)
             p = float(self.p)
             DC0 = np.sum(mvals**self.p)
             DC1 = self.p*(mvals**(self.p-1))
-            DC2 = np.diag(self.p*(self.p-1)*(mvals**(self.p-2)))
+            DC2 = self.p*(self.p-1)*(mvals**(self.p-2))
             return DC0, DC1, DC2
 
     def HYP(self, mvals):
@@ -500,19 +692,24 @@ class Penalty(object):
         @param[in] mvals The parameter vector
         @return DC0 The hyperbolic penalty
         @return DC1 The gradient
-        @return DC2 The Hessian
+        @return DC2 The diagonal elements of the Hessian (the off-diagonal elements are zero)
 
         """
-        mvals = np.array(mvals)
-        NP = len(mvals)
-        sqt   = (mvals**2 + self.b**2)**0.5
+        mvals = np.asarray(mvals, dtype=float)
+        sqt   = (mvals*mvals + self._b2)**0.5
+        isqt  = 1.0/sqt
         DC0   = np.sum(sqt - self.b)
-        DC1   = mvals*(1.0/sqt)
-        DC2   = np.diag(self.b**2*(1.0/sqt**3))
+        DC1   = mvals*isqt
+        DC2   = self._b2*isqt*isqt*isqt
 
         return DC0, DC1, DC2
 
-    def FUSE(self, mvals):
+    def _build_groups(self):
+        """
+        Group the parameter indices by element and angular momentum for
+        the fusion penalties.  The parameter list does not change during
+        the optimization, so this is done once and cached.
+        """
         Groups = defaultdict(list)
         for p, pid in enumerate(self.FF.plist):
             if 'Exponent' not in pid or len(pid.split()) != 1:
@@ -522,141 +719,47 @@ class Penalty(object):
                 warn_press_key("More than one contraction coefficient found!  You should expect the unexpected")
             key = Data['Elem']+'_'+Data['AMom']
             Groups[key].append(p)
-        pvals = self.FF.create_pvals(mvals)
-        DC0 = 0.0
-        DC1 = np.zeros(self.FF.np)
-        DC2 = np.zeros(self.FF.np)
-        for gnm, pidx in Groups.items():
-            # The group of parameters for a particular element / angular momentum.
-            pvals_grp = pvals[pidx]
-            # The order that the parameters come in.
-            Order = np.argsort(pvals_grp)
-            # The number of nearest neighbor pairs.
-            #print Order
-            for p in range(len(Order) - 1):
-                # The pointers to the parameter indices.
-                pi = pidx[Order[p]]
-                pj = pidx[Order[p+1]]
-                # pvals[pi] is the SMALLER parameter.
-                # pvals[pj] is the LARGER parameter.
-                dp = np.log(pvals[pj]) - np.log(pvals[pi])
-                # dp = (np.log(pvals[pj]) - np.log(pvals[pi])) / self.spacings[gnm]
-                DC0     += (dp**2 + self.b**2)**0.5 - self.b
-                DC1[pi] -= dp*(dp**2 + self.b**2)**-0.5
-                DC1[pj] += dp*(dp**2 + self.b**2)**-0.5
-                # The second derivatives have off-diagonal terms,
-                # but we're not using them right now anyway
-                # I will implement them if necessary.
-                # DC2[pi] -= self.b**2*(dp**2 + self.b**2)**-1.5
-                # DC2[pj] += self.b**2*(dp**2 + self.b**2)**-1.5
-                #print "pvals[%i] = %.4f, pvals[%i] = %.4f dp = %.4f" % (pi, pvals[pi], pj, pvals[pj], dp),
-                #print "First Derivative = % .4f, Second Derivative = % .4f" % (dp*(dp**2 + self.b**2)**-0.5, self.b**2*(dp**2 + self.b**2)**-1.5)
-        return DC0, DC1, np.diag(DC2)
+        self._fuse_groups = OrderedDict([(key, np.array(pidx, dtype=int)) for key, pidx in Groups.items()])
 
-    def FUSE_BARRIER(self, mvals):
-        Groups = defaultdict(list)
-        for p, pid in enumerate(self.FF.plist):
-            if 'Exponent' not in pid or len(pid.split()) != 1:
-                warn_press_key("Fusion penalty currently implemented only for basis set optimizations, where parameters are like this: Exponent:Elem=H,AMom=D,Bas=0,Con=0")
-            Data = dict([(i.split('=')[0],i.split('=')[1]) for i in pid.split(':')[1].split(',')])
-            if 'Con' not in Data or Data['Con'] != '0':
-                warn_press_key("More than one contraction coefficient found!  You should expect the unexpected")
-            key = Data['Elem']+'_'+Data['AMom']
-            Groups[key].append(p)
+    def _fuse(self, mvals, kernel):
+        """
+        Common driver for the fusion penalties.  Within each element /
+        angular momentum group the parameters are sorted, and the kernel
+        evaluates the penalty on the log-differences of nearest neighbors.
+
+        @param[in] mvals The parameter vector
+        @param[in] kernel One of the _fuse*_kernel functions
+        @return DC0 The fusion penalty
+        @return DC1 The gradient
+        """
+        if self._fuse_groups is None:
+            self._build_groups()
         pvals = self.FF.create_pvals(mvals)
         DC0 = 0.0
         DC1 = np.zeros(self.FF.np)
-        DC2 = np.zeros(self.FF.np)
-        for gnm, pidx in Groups.items():
-            # The group of parameters for a particular element / angular momentum.
-            pvals_grp = pvals[pidx]
-            # The order that the parameters come in.
-            Order = np.argsort(pvals_grp)
-            # The number of nearest neighbor pairs.
-            #print Order
-            for p in range(len(Order) - 1):
-                # The pointers to the parameter indices.
-                pi = pidx[Order[p]]
-                pj = pidx[Order[p+1]]
-                # pvals[pi] is the SMALLER parameter.
-                # pvals[pj] is the LARGER parameter.
-                dp = np.log(pvals[pj]) - np.log(pvals[pi])
-                # dp = (np.log(pvals[pj]) - np.log(pvals[pi])) / self.spacings[gnm]
-                DC0     += (dp**2 + self.b**2)**0.5 - self.b - self.a*np.log(dp) + self.a*np.log(self.a)
-                DC1[pi] -= dp*(dp**2 + self.b**2)**-0.5 - self.a/dp
-                DC1[pj] += dp*(dp**2 + self.b**2)**-0.5 - self.a/dp
-                # The second derivatives have off-diagonal terms,
-                # but we're not using them right now anyway
-                # I will implement them later if necessary.
-                # DC2[pi] -= self.b**2*(dp**2 + self.b**2)**-1.5 - self.a/dp**2
-                # DC2[pj] += self.b**2*(dp**2 + self.b**2)**-1.5 - self.a/dp**2
-                #print "pvals[%i] = %.4f, pvals[%i] = %.4f dp = %.4f" % (pi, pvals[pi], pj, pvals[pj], dp),
-                #print "First Derivative = % .4f, Second Derivative = % .4f" % (dp*(dp**2 + self.b**2)**-0.5, self.b**2*(dp**2 + self.b**2)**-1.5)
-        return DC0, DC1, np.diag(DC2)
+        for gnm, pidx in self._fuse_groups.items():
+            # The group of parameters for a particular element / angular momentum,
+            # sorted in order of increasing parameter value.
+            psrt = pidx[np.argsort(pvals[pidx])]
+            dc0, dpair = kernel(np.log(pvals[psrt]), self.a, self.b, self._b2)
+            DC0 += dc0
+            # psrt[:-1] are the SMALLER and psrt[1:] are the LARGER parameters in each pair.
+            # Each parameter occurs at most once on either side of a pair,
+            # so the fancy-indexed updates below do not collide.
+            DC1[psrt[:-1]] -= dpair
+            DC1[psrt[1:]] += dpair
+        return DC0, DC1
 
+    def FUSE(self, mvals):
+        DC0, DC1 = self._fuse(mvals, _fuse_kernel)
+        return DC0, DC1, np.zeros(self.FF.np)
 
-    def FUSE_L0(self, mvals):
-        Groups = defaultdict(list)
-        for p, pid in enumerate(self.FF.plist):
-            if 'Exponent' not in pid or len(pid.split()) != 1:
-                warn_press_key("Fusion penalty currently implemented only for basis set optimizations, where parameters are like this: Exponent:Elem=H,AMom=D,Bas=0,Con=0")
-            Data = dict([(i.split('=')[0],i.split('=')[1]) for i in pid.split(':')[1].split(',')])
-            if 'Con' not in Data or Data['Con'] != '0':
-                warn_press_key("More than one contraction coefficient found!  You should expect the unexpected")
-            key = Data['Elem']+'_'+Data['AMom']
-            Groups[key].append(p)
-        pvals = self.FF.create_pvals(mvals)
-        #print "pvals: ", pvals
-        DC0 = 0.0
-        DC1 = np.zeros(self.FF.np)
-        DC2 = np.zeros((self.FF.np,self.FF.np))
-        for gnm, pidx in Groups.items():
-            # The group of parameters for a particular element / angular momentum.
-            pvals_grp = pvals[pidx]
-            # The order that the parameters come in.
-            Order = np.argsort(pvals_grp)
-            # The number of nearest neighbor pairs.
-            #print Order
-            Contribs = []
-            dps = []
-            for p in range(len(Order) - 1):
-                # The pointers to the parameter indices.
-                pi = pidx[Order[p]]
-                pj = pidx[Order[p+1]]
-                # pvals[pi] is the SMALLER parameter.
-                # pvals[pj] is the LARGER parameter.
-                dp = np.log(pvals[pj]) - np.log(pvals[pi])
-                # dp = (np.log(pvals[pj]) - np.log(pvals[pi])) / self.spacings[gnm]
-                dp2b2 = dp**2 + self.b**2
-                h   = self.a*((dp2b2)**0.5 - self.b)
-                hp  = self.a*(dp*(dp2b2)**-0.5)
-                hpp = self.a*(self.b**2*(dp2b2)**-1.5)
-                emh = np.exp(-1*h)
-                dps.append(dp)
-                Contribs.append((1.0 - emh))
-                DC0     += (1.0 - emh)
-                DC1[pi] -= hp*emh
-                DC1[pj] += hp*emh
-        # for i in self.FF.redirect:
-        #     p = mvals[i]
-        #     DC0 += 1e-6*p*p
-        #     DC1[i] = 2e-6*p
-
-                # The second derivatives have off-diagonal terms,
-                # but we're not using them right now anyway
-                #DC2[pi,pi] += (hpp - hp**2)*emh
-                #DC2[pi,pj] -= (hpp - hp**2)*emh
-                #DC2[pj,pi] -= (hpp - hp**2)*emh
-                #DC2[pj,pj] += (hpp - hp**2)*emh
-                #print "pvals[%i] = %.4f, pvals[%i] = %.4f dp = %.4f" % (pi, pvals[pi], pj, pvals[pj], dp),
-                #print "First Derivative = % .4f, Second Derivative = % .4f" % (dp*(dp**2 + self.b**2)**-0.5, self.b**2*(dp**2 + self.b**2)**-1.5)
-
-            #print "grp:", gnm, "dp:", ' '.join(["% .1e" % i for i in dps]), "Contributions:", ' '.join(["% .1e" % i for i in Contribs])
-
-        #print DC0, DC1, DC2
-        #print pvals
-        #raw_input()
+    def FUSE_BARRIER(self, mvals):
+        DC0, DC1 = self._fuse(mvals, _fuse_barrier_kernel)
+        return DC0, DC1, np.zeros(self.FF.np)
 
-        return DC0, DC1, DC2
+    def FUSE_L0(self, mvals):
+        DC0, DC1 = self._fuse(mvals, _fuse_l0_kernel)
+        return DC0, DC1, np.zeros(self.FF.np)
 
     #return self.HYP(mvals)
@@ -629,9 +629,9 @@ class Optimizer(forcebalance.BaseClass):
                 bar = printcool("Total Hessian",color=4)
                 pmat2d(H,precision=8)
                 logger.info(bar)
-            for key, val in self.Objective.ObjDict.items():
-                if Best_Step:
-                    self.Objective.ObjDict_Last[key] = val
+            if Best_Step:
+                # Target_Terms starts a new ObjDict on the next evaluation, so the reference can be kept as is.
+                self.Objective.ObjDict_Last = self.Objective.ObjDict
             #================================#
             #|  Check convergence criteria. |#
             #================================#
@@ -49,12 +49,15 @@ from __future__ import absolute_import
 
 from builtins import str
 import os
+import io
 import re
 import sys
+from sys import intern
 import itertools
 import traceback
 from .nifty import printcool, printcool_dictionary, which, isfloat
-from copy import deepcopy
+from copy import copy, deepcopy
+from functools import lru_cache
 from collections import OrderedDict
 
 from forcebalance.output import getLogger
@@ -293,20 +296,21 @@ for i in all_opts_names:
         raise RuntimeError
 
 ## Default general options - basically a collapsed veresion of gen_opts_types.
-gen_opts_defaults = {}
-for t in gen_opts_types:
-    subdict = {}
-    for i in gen_opts_types[t]:
-        subdict[i] = gen_opts_types[t][i][0]
-    gen_opts_defaults.update(subdict)
+gen_opts_defaults = {key: val[0] for typ in gen_opts_types.values() for key, val in typ.items()}
 
 ## Default target options - basically a collapsed version of tgt_opts_types.
-tgt_opts_defaults = {}
-for t in tgt_opts_types:
-    subdict = {}
-    for i in tgt_opts_types[t]:
-        subdict[i] = tgt_opts_types[t][i][0]
-    tgt_opts_defaults.update(subdict)
+tgt_opts_defaults = {key: val[0] for typ in tgt_opts_types.values() for key, val in typ.items()}
+
+## Target options whose default values are containers (e.g. lists) that must not be shared
+## between targets; all other default values are immutable.
+_TGT_MUTABLE_KEYS = tuple(key for key, val in tgt_opts_defaults.items() if isinstance(val, (list, dict)))
+
+def _fresh_tgt_opts():
+    """ Return a new dictionary of default target options, copying only the mutable values. """
+    this_tgt_opt = tgt_opts_defaults.copy()
+    for key in _TGT_MUTABLE_KEYS:
+        this_tgt_opt[key] = copy(tgt_opts_defaults[key])
+    return this_tgt_opt
 
 ## Option maps for maintaining backward compatibility.
 bkwd = {"simtype" : "type",
@@ -324,29 +328,49 @@ bkwd = {"simtype" : "type",
         }
 
 ## Listing of sections in the input file.
-mainsections = ["SIMULATION","TARGET","OPTIONS","END","NONE"]
-
-def read_mvals(fobj):
+mainsections = frozenset(("SIMULATION","TARGET","OPTIONS","END","NONE"))
+## Sections that contain target options, and sections that contain options of any kind.
+_TGT_SECTIONS = frozenset(("SIMULATION","TARGET"))
+_OPT_SECTIONS = frozenset(("OPTIONS","SIMULATION","TARGET"))
+
+## Words that mark the end of a subsection (checked with str.startswith).  Any of them ends
+## any subsection, since a terminator of another subsection cannot occur inside this one.
+_END_TOKENS_ALL = ("$end", "/read_mvals", "/read_pvals", "/priors")
+## The last word between the first "[" and the following "]" (or the last word on the line).
+_BRACKET_LAST = re.compile(r"(?:[^\[]*\[)?[^\]]*?([^\s\[\]]+)\s*(?:\]|$)")
+
+## Order in which the variable types are printed by printsection, and their singular names.
+_VARTYPE_ORDER = ('strings','allcaps','lists','ints','bools','floats','sections')
+_VARTYPE_SINGULAR = {'strings':'string','allcaps':'allcap','lists':'list','ints':'int',
+                     'bools':'bool','floats':'float','sections':'section'}
+
+def _read_bracketed_floats(fobj):
+    """ Read one number per line until the end of the subsection.  The number is
+    the last word inside the square brackets, e.g. "0 [ 1.0000e-01 ] : VDWS:HW",
+    or the last word on the line if there are no brackets. """
     Answer = []
+    match = _BRACKET_LAST.match
     for line in fobj:
-        if re.match("(/read_mvals)|(^\$end)",line):
+        if line.lstrip().startswith(_END_TOKENS_ALL):
             break
-        Answer.append(float(line.split('[', maxsplit=1)[-1].split(']', maxsplit=1)[0].split()[-1]))
+        m = match(line)
+        if m is None:
+            logger.error("Expected a number on this line: %s\n" % line.rstrip())
+            raise RuntimeError
+        Answer.append(float(m.group(1)))
     return Answer
 
+def read_mvals(fobj):
+    return _read_bracketed_floats(fobj)
+
 def read_pvals(fobj):
-    Answer = []
-    for line in fobj:
-        if re.match("(/read_pvals)|(^\$end)",line):
-            break
-        Answer.append(float(line.split('[', maxsplit=1)[-1].split(']', maxsplit=1)[0].split()[-1]))
-    return Answer
+    return _read_bracketed_floats(fobj)
 
 def read_priors(fobj):
     Answer = OrderedDict()
     for line in fobj:
         line = line.split("#")[0]
-        if re.match("(/priors)|(^\$end)",line):
+        if line.lstrip().startswith(_END_TOKENS_ALL):
             break
         Answer[line.split()[0]] = float(line.split()[-1])
     return Answer
@@ -361,8 +385,70 @@ ParsTab  = {"read_mvals" : read_mvals,
             "internal"   : read_internals
             }
 
-def printsection(heading,optdict,typedict):
-    """ Print out a section of the input file in a parser-compliant and readable format.
+## Flat lookup tables from each option name to its canonical name and variable type.
+## The old names in bkwd are included, so that they are translated by the same lookup.
+_GEN_KEY_KIND = dict([(key, (key, kind)) for kind in _VARTYPE_ORDER for key in gen_opts_types[kind]])
+_TGT_KEY_KIND = dict([(key, (key, kind)) for kind in _VARTYPE_ORDER for key in tgt_opts_types[kind]])
+for _table in (_GEN_KEY_KIND, _TGT_KEY_KIND):
+    for _old, _new in bkwd.items():
+        if _new in _table:
+            _table[_old] = _table[_new]
+
+## Values accepted for switching a boolean option off or on.
+_BOOL_FALSE = frozenset(("0", "NO", "FALSE", "OFF"))
+_BOOL_TRUE = frozenset(("1", "YES", "TRUE", "ON"))
+
+## Functions that set an option from a line of the input file, one for each variable type.
+## Each one takes the options dictionary, the keyword, the split line and the iterator
+## over the lines of the file (used by subsections).
+def _set_string(this_opt, key, s, fobj):
+    this_opt[key] = s[1]
+
+def _set_allcaps(this_opt, key, s, fobj):
+    this_opt[key] = s[1].upper()
+
+def _append_list(this_opt, key, s, fobj):
+    for word in s[1:]:
+        this_opt.setdefault(key,[]).append(word)
+
+def _set_int(this_opt, key, s, fobj):
+    if isfloat(s[1]):
+        this_opt[key] = int(float(s[1]))
+    else:
+        this_opt[key] = int(s[1])
+
+def _set_bool(this_opt, key, s, fobj):
+    if len(s) == 1:
+        this_opt[key] = True
+    elif s[1].upper() in _BOOL_FALSE:
+        this_opt[key] = False
+    elif isfloat(s[1]) and int(float(s[1])) == 0:
+        this_opt[key] = False
+    elif s[1].upper() in _BOOL_TRUE:
+        this_opt[key] = True
+    elif isfloat(s[1]) and int(float(s[1])) == 1:
+        this_opt[key] = True
+    else:
+        logger.error('%s is a true/false option but you provided %s; to enable, provide ["1", "yes", "true", "on" or <no value>].  To disable, provide ["0", "no", "false", or "off"].\n' % (key, s[1]))
+        raise RuntimeError
+
+def _set_float(this_opt, key, s, fobj):
+    this_opt[key] = float(s[1])
+
+def _set_section(this_opt, key, s, fobj):
+    this_opt[key] = ParsTab[key](fobj)
+
+_DISPATCH = {'strings'  : _set_string,
+             'allcaps'  : _set_allcaps,
+             'lists'    : _append_list,
+             'ints'     : _set_int,
+             'bools'    : _set_bool,
+             'floats'   : _set_float,
+             'sections' : _set_section
+             }
+
+def iter_section(heading,optdict,typedict):
+    """ Generate a section of the input file in a parser-compliant and readable format.
 
     At the time of writing of this function, it's mainly intended to be called by MakeInputFile.py.
     The heading is printed first (it is something like $options or $target).  Then it loops
@@ -374,7 +460,7 @@ def printsection(heading,optdict,typedict):
     @param[in] heading Heading, either $options or $target
     @param[in] optdict Options dictionary or None.
     @param[in] typedict Option type dictionary, either gen_opts_types or tgt_opts_types specified in this file.
-    @return Answer List of strings for the section that we are printing out.
+    @return Generator over the lines of the section that we are printing out.
 
     """
     from forcebalance.objective import Implemented_Targets
@@ -389,25 +475,25 @@ def printsection(heading,optdict,typedict):
                 list_out.append(Implemented_Targets[key].__name__)
         return ', '.join(sorted(list_out))
 
-    Answer = [heading]
+    yield heading
     firstentry = 1
     Options = []
-    for i in ['strings','allcaps','lists','ints','bools','floats','sections']:
-        vartype = re.sub('s$','',i)
-        for j in typedict[i]:
+    for i in _VARTYPE_ORDER:
+        vartype = _VARTYPE_SINGULAR[i]
+        for j, entry in typedict[i].items():
             Option = []
-            val = optdict[j] if optdict is not None else typedict[i][j][0]
+            Default, Priority, Doc = entry[:3]
+            val = optdict[j] if optdict is not None else Default
             if firstentry:
                 firstentry = 0
             else:
                 Option.append("")
-            Priority = typedict[i][j][1]
-            Option.append("# (%s) %s" % (vartype, typedict[i][j][2]))
-            if len(typedict[i][j]) >= 4:
-                Relevance = typedict[i][j][3]
+            Option.append("# (%s) %s" % (vartype, Doc))
+            if len(entry) >= 4:
+                Relevance = entry[3]
                 str2 = "# used in: %s" % Relevance
-                if len(typedict[i][j]) >= 5:
-                    TargetName = FilterTargets(typedict[i][j][4])
+                if len(entry) >= 5:
+                    TargetName = FilterTargets(entry[4])
                     str2 += " (%s)" % TargetName
                 else:
                     TargetName = "None"
@@ -426,7 +512,8 @@ def printsection(heading,optdict,typedict):
     Options.sort(key=key2)
     Options.sort(key=key1, reverse=True)
     for o in Options:
-        Answer += o[0]
+        for line in o[0]:
+            yield line
 
     # PriSet = sorted(list(set(Priorities)))[::-1]
     # TgtSet = sorted(list(set(TargetNames)))
@@ -447,8 +534,18 @@ def printsection(heading,optdict,typedict):
     #             if t == t0:
     #                 ogrp2.append(
 
-    Answer.append("$end")
-    return Answer
+    yield "$end"
+
+def printsection(heading,optdict,typedict):
+    """ Print out a section of the input file in a parser-compliant and readable format.
+
+    @param[in] heading Heading, either $options or $target
+    @param[in] optdict Options dictionary or None.
+    @param[in] typedict Option type dictionary, either gen_opts_types or tgt_opts_types specified in this file.
+    @return Answer List of strings for the section that we are printing out (see iter_section).
+
+    """
+    return list(iter_section(heading,optdict,typedict))
 
 def parse_inputs(input_file=None):
     """ Parse through the input file and read all user-supplied options.
@@ -465,6 +562,9 @@ def parse_inputs(input_file=None):
     Each target has its own section delimited by the \em $target keyword,
     and we build a list of target options.
 
+    The parsed options are cached, so parsing an unmodified file again from the
+    same directory only returns a copy of the previous result.
+
     @param[in]  input_file The name of the input file.
     @return     options    General options.
     @return     tgt_opts   List of fitting target options.
@@ -475,73 +575,89 @@ def parse_inputs(input_file=None):
     """
 
     logger.info("Reading options from file: %s\n" % input_file)
+    # Give back a bunch of default options if input file isn't specified.
+    if input_file is None:
+        options = deepcopy(gen_opts_defaults) # deepcopy to make sure options doesn't make changes to gen_opts_defaults
+        options['root'] = os.getcwd()
+        options['input_file'] = input_file
+        return (options, [_fresh_tgt_opts()])
+    # The options depend only on the file contents, the file name as given and the
+    # current directory (stored as 'root'), so a file that has not been modified
+    # since it was last parsed from the same place is not read again.
+    st = os.stat(input_file)
+    options, tgt_opts = _parse_inputs_file(input_file, os.getcwd(), st.st_mtime_ns, st.st_size)
+    if not options['verbose_options']:
+        printcool("Options at their default values are not printed\n Use 'verbose_options True' to Enable", color=5)
+    # Return copies so that the caller may modify the options without changing the cache.
+    return deepcopy((options, tgt_opts))
+
+@lru_cache(maxsize=32)
+def _parse_inputs_file(input_file, root, mtime, size):
+    """ Read the options from an input file; called by parse_inputs.
+
+    @param[in]  input_file The name of the input file.
+    @param[in]  root       The directory that the input file is read from.
+    @param[in]  mtime      Modification time of the input file (used to invalidate the cache).
+    @param[in]  size       Size of the input file (used to invalidate the cache).
+    @return     options    General options.
+    @return     tgt_opts   List of fitting target options.
+    """
     section = "NONE"
     # First load in all of the default options.
     options = deepcopy(gen_opts_defaults) # deepcopy to make sure options doesn't make changes to gen_opts_defaults
-    options['root'] = os.getcwd()
+    options['root'] = root
     options['input_file'] = input_file
     tgt_opts = []
-    this_tgt_opt = deepcopy(tgt_opts_defaults)
-    # Give back a bunch of default options if input file isn't specified.
-    if input_file is None:
-        return (options, [this_tgt_opt])
-    fobj = open(input_file)
-    for line in fobj:
+    this_tgt_opt = _fresh_tgt_opts()
+    ## The options dictionary and key lookup for the current section; these only change with the section.
+    this_opt, kind_of = None, None
+    ## Local names for lookups made on every line.
+    dispatch = _DISPATCH
+    # Input files are small, so the whole file is read at once.  The subsection readers in
+    # ParsTab continue from the same iterator over the lines, which are the same as when
+    # iterating over the file (including the line endings).
+    with io.open(input_file, 'r') as f:
+        lines = iter(io.StringIO(f.read()))
+    for line in lines:
+        # Skip over blank lines and comment lines without splitting them
+        stripped = line.lstrip()
+        if not stripped or stripped[0] == '#':
+            continue
         try:
             # Anything after "#" is a comment
-            line = line.split("#")[0].strip()
+            line = stripped.partition("#")[0].rstrip()
             s = line.split()
-            # Skip over blank lines
-            if len(s) == 0:
-                continue
-            key = s[0].lower()
-            if key in bkwd: # Do option replacement for backward compatibility.
-                key = bkwd[key]
+            # Interned keywords are found in the key tables by identity.
+            key = intern(s[0].lower())
             # If line starts with a $, this signifies that we're in a new section.
-            if re.match('^\$',line):
-                newsection = re.sub('^\$','',line).upper()
-                if section in ["SIMULATION","TARGET"] and newsection in mainsections:
+            if line.startswith('$'):
+                newsection = intern(line[1:].upper())
+                if newsection not in mainsections:
+                    logger.error("Unrecognized section: %s\n" % newsection)
+                    raise RuntimeError
+                if section in _TGT_SECTIONS:
                     tgt_opts.append(this_tgt_opt)
-                    this_tgt_opt = deepcopy(tgt_opts_defaults)
+                    this_tgt_opt = _fresh_tgt_opts()
                 if newsection == "END": newsection = "NONE"
                 section = newsection
-            elif section in ["OPTIONS","SIMULATION","TARGET"]:
-                ## Depending on which section we are in, we choose the correct type dictionary
+                ## Depending on which section we are in, we choose the correct key lookup table
                 ## and add stuff to 'options' and 'this_tgt_opt'
-                (this_opt, opts_types) = (options, gen_opts_types) if section == "OPTIONS" else (this_tgt_opt, tgt_opts_types)
+                if section == "OPTIONS":
+                    this_opt, kind_of = options, _GEN_KEY_KIND.get
+                elif section in _TGT_SECTIONS:
+                    this_opt, kind_of = this_tgt_opt, _TGT_KEY_KIND.get
+            elif section in _OPT_SECTIONS:
+                entry = kind_of(key)
+                if entry is not None:
+                    key, kind = entry
+                else:
+                    # Not an option in this section; the error message refers to the new name.
+                    key, kind = bkwd.get(key, key), None
                 ## Note that "None" is a special keyword!  The variable will ACTUALLY be set to None.
                 if len(s) > 1 and s[1].upper() == "NONE":
                     this_opt[key] = None
-                elif key in opts_types['strings']:
-                    this_opt[key] = s[1]
-                elif key in opts_types['allcaps']:
-                    this_opt[key] = s[1].upper()
-                elif key in opts_types['lists']:
-                    for word in s[1:]:
-                        this_opt.setdefault(key,[]).append(word)
-                elif key in opts_types['ints']:
-                    if isfloat(s[1]):
-                        this_opt[key] = int(float(s[1]))
-                    else:
-                        this_opt[key] = int(s[1])
-                elif key in opts_types['bools']:
-                    if len(s) == 1:
-                        this_opt[key] = True
-                    elif s[1].upper() in ["0", "NO", "FALSE", "OFF"]:
-                        this_opt[key] = False
-                    elif isfloat(s[1]) and int(float(s[1])) == 0:
-                        this_opt[key] = False
-                    elif s[1].upper() in ["1", "YES", "TRUE", "ON"]:
-                        this_opt[key] = True
-                    elif isfloat(s[1]) and int(float(s[1])) == 1:
-                        this_opt[key] = True
-                    else:
-                        logger.error('%s is a true/false option but you provided %s; to enable, provide ["1", "yes", "true", "on" or <no value>].  To disable, provide ["0", "no", "false", or "off"].\n' % (key, s[1]))
-                        raise RuntimeError
-                elif key in opts_types['floats']:
-                    this_opt[key] = float(s[1])
-                elif key in opts_types['sections']:
-                    this_opt[key] = ParsTab[key](fobj)
+                elif kind is not None:
+                    dispatch[kind](this_opt, key, s, lines)
                 else:
                     logger.error("Unrecognized keyword: --- \x1b[1;91m%s\x1b[0m --- in %s section\n" \
                           % (key, section))
@@ -551,18 +667,13 @@ def parse_inputs(input_file=None):
             elif section == "NONE" and len(s) > 0:
                 logger.error("Encountered a non-comment line outside of a section\n")
                 raise RuntimeError
-            elif section not in mainsections:
-                logger.error("Unrecognized section: %s\n" % section)
-                raise RuntimeError
         except:
             # traceback.print_exc()
             logger.exception("Failed to read in this line! Check your input file.\n")
             logger.exception('\x1b[91m' + line + '\x1b[0m\n')
             raise RuntimeError
-    if section == "SIMULATION" or section == "TARGET":
+    if section in _TGT_SECTIONS:
         tgt_opts.append(this_tgt_opt)
-    if not options['verbose_options']:
-        printcool("Options at their default values are not printed\n Use 'verbose_options True' to Enable", color=5)
     # Expand target options (i.e. create multiple tgt_opts dictionaries if multiple target names are specified)
     tgt_opts_x = []
     for topt in tgt_opts:
@@ -94,6 +94,117 @@ class TestPenalty(ForceBalanceTestCase):
             assert isinstance(result,tuple)
             # more tests go here
 
+    def test_penalty_compute_switched_off(self):
+        """Check penalty computation returns zeros when no penalty is active"""
+        objective = {'G': numpy.zeros((9)),
+         'H': numpy.diag((1,)*9),
+         'X': 1}
+        penalty = forcebalance.objective.Penalty('L2', self.ff, 0.0, 0.0)
+        X, G, H = penalty.compute(numpy.ones(self.np), objective)
+        assert X == 0.0
+        assert G.shape == (self.np,) and not G.any()
+        assert H.shape == (self.np, self.np) and not H.any()
+
+    def test_penalty_hessian_vector_product(self):
+        """Check penalty Hessian-vector products against the penalty Hessian"""
+        # Small parameter changes keep the fusion penalties (which take logarithms) finite.
+        mvals = numpy.random.RandomState(0).uniform(-0.01, 0.01, self.np)
+        v = numpy.linspace(1.0, 2.0, self.np)
+        objective = {'G': numpy.linspace(-1.0, 1.0, self.np),
+         'H': numpy.eye(self.np),
+         'X': 1.0}
+        for ptype in forcebalance.objective.Penalty.Pen_Names.keys():
+            penalty = forcebalance.objective.Penalty(ptype, self.ff, 0.01, 0.1,
+                                self.options['penalty_hyperbolic_b'],
+                                self.options['penalty_alpha'])
+            H = penalty.compute(mvals, objective)[2]
+            Hv = penalty.Hv(mvals, v, objective, numpy.dot(objective['H'], v))
+            assert numpy.isfinite(H).all() and numpy.isfinite(Hv).all()
+            numpy.testing.assert_allclose(Hv, numpy.dot(H, v), rtol=1e-10, atol=1e-12)
+
+class QuadraticTarget(object):
+    """ Stand-in for a fitting target with a quadratic objective function. """
+    def __init__(self, name, weight, A, b):
+        self.name = name
+        self.weight = weight
+        self.A = A
+        self.b = b
+        self.staged = []
+        self.removed = []
+
+    def stage(self, mvals, AGrad=False, AHess=False, customdir=None):
+        self.staged.append(customdir)
+
+    def remove_custom_dir(self, dnm):
+        self.removed.append(dnm)
+
+    def get_X(self, mvals, customdir=None):
+        mvals = numpy.asarray(mvals)
+        return {'X': 0.5*mvals.dot(self.A).dot(mvals) + self.b.dot(mvals) + 1.0,
+                'G': numpy.zeros(len(mvals)), 'H': numpy.zeros((len(mvals), len(mvals)))}
+
+    def get_G(self, mvals, customdir=None):
+        Ans = self.get_X(mvals, customdir)
+        Ans['G'] = self.A.dot(mvals) + self.b
+        return Ans
+
+    def get_H(self, mvals, customdir=None):
+        Ans = self.get_G(mvals, customdir)
+        Ans['H'] = self.A.copy()
+        return Ans
+
+class TestQuadraticObjective(ForceBalanceTestCase):
+    def setup_method(self, method):
+        super(TestQuadraticObjective, self).setup_method(method)
+        self.cwd = os.path.dirname(os.path.realpath(__file__))
+        os.chdir(os.path.join(self.cwd, 'files'))
+        self.options=forcebalance.parser.gen_opts_defaults.copy()
+        self.options.update({
+                'root': os.getcwd(),
+                'penalty_additive': 0.01,
+                'penalty_multiplicative': 0.1,
+                'normalize_weights': False,
+                'jobtype': 'NEWTON',
+                'forcefield': ['cc-pvdz-overlap-original.gbs']})
+        self.ff = forcebalance.forcefield.FF(self.options)
+        self.np = self.ff.np
+        self.objective = forcebalance.objective.Objective(self.options, [], self.ff)
+        rng = numpy.random.RandomState(1)
+        self.targets = []
+        for i, weight in enumerate([1.0, 0.5]):
+            M = rng.normal(size=(self.np, self.np))
+            self.targets.append(QuadraticTarget("target_%i" % i, weight, M.dot(M.T)/self.np, rng.normal(size=self.np)))
+        self.objective.Targets = self.targets
+
+    def test_objective_hessian_vector_product(self):
+        """Check objective Hessian-vector products against the full Hessian"""
+        mvals = numpy.random.RandomState(2).uniform(-0.01, 0.01, self.np)
+        v = numpy.linspace(1.0, 2.0, self.np)
+        Objective = self.objective.Full(mvals, Order=2)
+        ObjDict = self.objective.ObjDict
+        Hv = self.objective.Hv(mvals, v, Objective)
+        numpy.testing.assert_allclose(Hv, Objective['H'].dot(v), rtol=1e-6)
+        # Without the objective function dictionary, the gradient at mvals is computed again.
+        numpy.testing.assert_allclose(self.objective.Hv(mvals, v), Hv, rtol=1e-10)
+        # The displaced gradient is evaluated in its own directory, which is removed afterward.
+        for Tgt in self.targets:
+            assert Tgt.staged == [None, "hessvec", None, "hessvec"]
+            assert Tgt.removed == ["hessvec", "hessvec"]
+        # The objective function breakdown from Full is kept.
+        assert self.objective.ObjDict is ObjDict
+        assert 'Regularization' in self.objective.ObjDict
+
+    def test_indicate_new_target(self):
+        """Check objective.Indicate() runs when a target is missing from the previous breakdown"""
+        mvals = numpy.zeros(self.np)
+        self.objective.Targets = self.targets[:1]
+        self.objective.Full(mvals, Order=0)
+        self.objective.Indicate()
+        self.objective.ObjDict_Last = self.objective.ObjDict
+        self.objective.Targets = self.targets
+        self.objective.Full(mvals, Order=0)
+        self.objective.Indicate()
+
 class ObjectiveTests(object):
     def test_target_zero_order_terms(self):
         """Check zero order target terms"""
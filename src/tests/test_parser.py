@@ -1,5 +1,7 @@
 import os
+import io
 import shutil
+import pytest
 import forcebalance.parser
 from .__init__ import ForceBalanceTestCase
 
@@ -41,3 +43,24 @@ class TestParser(ForceBalanceTestCase):
         output6 = forcebalance.parser.parse_inputs('test.in')
         assert output5 != output6
         os.remove('test.in')
+
+    def test_read_mvals(self):
+        """Check read_mvals() reads the bracketed values up to the end of the subsection"""
+        fobj = io.StringIO(u"0 [ 1.0000e-01 ] : VDWS:HW\n1 [-2.5]\n2  3.0\n/read_mvals\n4 [ 5.0 ]\n")
+        assert forcebalance.parser.read_mvals(fobj) == [0.1, -2.5, 3.0]
+        # The rest of the file is left for the main parser.
+        assert next(fobj) == "4 [ 5.0 ]\n"
+        # Empty brackets are reported as an error rather than read as a number.
+        with pytest.raises(RuntimeError):
+            forcebalance.parser.read_mvals(io.StringIO(u"0 [ ] : VDW\n/read_mvals\n"))
+
+    def test_parse_inputs_subsection_at_end_of_file(self):
+        """Check parse_inputs() reads subsections that run to the end of the file"""
+        os.chdir('files')
+        with open('test.in', 'w') as f:
+            f.write("$options\nread_mvals\n0 [ 1.0 ]\n")
+        assert forcebalance.parser.parse_inputs('test.in')[0]['read_mvals'] == [1.0]
+        with open('test.in', 'w') as f:
+            f.write("$options\npriors\n VDWS : 1.0\n")
+        assert forcebalance.parser.parse_inputs('test.in')[0]['priors'] == {'VDWS': 1.0}
+        os.remove('test.in')